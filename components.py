@@ -48,6 +48,11 @@ def display_sidebar():
     st.session_state.mode = st.sidebar.radio(
         "モード選択", [ct.ANSWER_MODE_1, ct.ANSWER_MODE_2], label_visibility="hidden"
     )
+    # 検索範囲（フォルダ単位のカテゴリ）の選択
+    categories = sorted(st.session_state.get("metadata_index", {}).get("category", {}))
+    st.session_state.search_scope = st.sidebar.selectbox(
+        ct.SIDEBAR_SCOPE_LABEL, [ct.SEARCH_SCOPE_ALL] + categories
+    )
     st.sidebar.markdown("---")
     st.sidebar.markdown(ct.SIDEBAR_SEARCH_INFO_HEADER)
     st.sidebar.info(ct.SIDEBAR_SEARCH_INFO_BODY)
@@ -106,24 +111,28 @@ def display_search_llm_response(llm_response):
         main_message = "入力内容に関する情報は、以下のファイルに含まれている可能性があります。"
         st.markdown(main_message)
         
-        main_context = llm_response["context"][0]
-        main_file_path = main_context.metadata["source"]
-        main_page_number = main_context.metadata.get("page", -1) + 1
+        # 重複排除で統合されたチャンクは、統合元（PDFとWordなど）すべてをありかの候補とする
+        locations = []
+        for document in llm_response["context"]:
+            locations.extend(utils.get_source_locations(document))
+
+        main_file_path = locations[0]["source"]
+        main_page_number = locations[0]["page_number"]
         
         create_download_button(main_file_path, main_page_number, "current_main")
         
         sub_choices = []
         duplicate_check_list = []
-        if len(llm_response["context"]) > 1:
+        if len(locations) > 1:
             sub_message = "その他、ファイルありかの候補を提示します。"
             st.markdown(sub_message)
-            for i, document in enumerate(llm_response["context"][1:]):
-                sub_file_path = document.metadata["source"]
+            for i, location in enumerate(locations[1:]):
+                sub_file_path = location["source"]
                 if sub_file_path == main_file_path or sub_file_path in duplicate_check_list:
                     continue
                 duplicate_check_list.append(sub_file_path)
                 
-                sub_page_number = document.metadata.get("page", -1) + 1
+                sub_page_number = location["page_number"]
                 create_download_button(sub_file_path, sub_page_number, f"current_sub_{i}")
                 
                 sub_choices.append({"source": sub_file_path, "page_number": sub_page_number})
@@ -147,13 +156,18 @@ def display_contact_llm_response(llm_response):
         message = "情報源"
         st.markdown(f"##### {message}")
         
+        # 重複排除で統合されたチャンクは、統合元すべてを情報源として表示
+        locations = []
+        for document in llm_response["context"]:
+            locations.extend(utils.get_source_locations(document))
+
         file_path_list = []
-        for i, document in enumerate(llm_response["context"]):
-            file_path = document.metadata["source"]
+        for i, location in enumerate(locations):
+            file_path = location["source"]
             if file_path in file_path_list: continue
             file_path_list.append(file_path)
             
-            page_number = document.metadata.get("page", -1) + 1
+            page_number = location["page_number"]
             create_download_button(file_path, page_number, f"current_contact_{i}")
             
             log_entry = {"source": file_path}
@@ -2,13 +2,6 @@
 このファイルは、固定の文字列や数値などのデータを変数として一括管理するファイルです。
 """
 
-############################################################
-# ライブラリの読み込み
-############################################################
-# ▼▼▼ TextLoader をインポートリストに追加 ▼▼▼
-from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, TextLoader, CSVLoader
-
-
 ############################################################
 # 共通変数の定義
 ############################################################
@@ -46,6 +39,9 @@ SIDEBAR_INQUIRY_EXAMPLE = "【入力例】\n人事部に所属している従業
 
 PAGE_NUMBER_TEMPLATE = "（ページNo.{page_number}）"
 
+SIDEBAR_SCOPE_LABEL = "検索範囲"
+SEARCH_SCOPE_ALL = "すべて"
+
 
 # ==========================================
 # ログ出力系
@@ -61,6 +57,34 @@ APP_BOOT_MESSAGE = "アプリが起動されました。"
 # ==========================================
 MODEL = "gpt-4o-mini"
 TEMPERATURE = 0.5
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+# ==========================================
+# トークン数・料金の集計系
+# ==========================================
+# 処理段階の名前
+TOKEN_STAGE_MULTI_QUERY = "multi_query"
+TOKEN_STAGE_QUERY_EMBEDDING = "query_embedding"
+TOKEN_STAGE_ANSWER = "answer"
+TOKEN_STAGE_INDEX_BUILD = "index_build"
+# tiktokenがモデル名に対応するエンコーディングを持たない場合に使うエンコーディング
+DEFAULT_TIKTOKEN_ENCODING = "cl100k_base"
+# チャットモデルの1メッセージあたりのオーバーヘッド（役割名などの区切りトークン）
+TOKENS_PER_MESSAGE = 3
+# 100万トークンあたりの料金（米ドル）: (入力, 出力)
+TOKEN_PRICES_PER_1M = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+# セッション単位・1日単位のトークン数の上限（Noneの場合は上限なし）
+# ベクターストア作成時の埋め込みは、1日単位の上限にのみ含める
+SESSION_TOKEN_BUDGET = None
+DAILY_TOKEN_BUDGET = None
+# 1日単位の合計トークン数を保存するファイル（ログ出力先のフォルダに日付ごとに作成）
+# （再起動や複数プロセスで起動した場合も、同じ日の合計を共有するため）
+DAILY_TOKEN_USAGE_FILE_TEMPLATE = "token_usage_{date}.json"
+DAILY_TOKEN_USAGE_LOCK_FILE = "token_usage.lock"
 
 
 # ==========================================
@@ -68,12 +92,14 @@ TEMPERATURE = 0.5
 # ==========================================
 RAG_TOP_FOLDER_PATH = "./data"
 
-# ▼▼▼ SUPPORTED_EXTENSIONS 辞書に .txt を追加 ▼▼▼
+# 拡張子ごとのローダー（モジュール名, クラス名, 追加引数, ローダーが内部で使うライブラリ）
+# 起動時間短縮のため、ローダーはインジェスト実行時に初めてインポートする
+# （インポート時間を正しく計測できるよう、遅延読み込みのパッケージではなく実体のモジュールを指定）
 SUPPORTED_EXTENSIONS = {
-    ".pdf": PyMuPDFLoader,
-    ".docx": Docx2txtLoader,
-    ".txt": lambda path: TextLoader(path, encoding="utf-8"),
-    ".csv": lambda path: CSVLoader(path, encoding="utf-8")
+    ".pdf": ("langchain_community.document_loaders.pdf", "PyMuPDFLoader", {}, ["fitz"]),
+    ".docx": ("langchain_community.document_loaders.word_document", "Docx2txtLoader", {}, ["docx2txt"]),
+    ".txt": ("langchain_community.document_loaders.text", "TextLoader", {"encoding": "utf-8"}, []),
+    ".csv": ("langchain_community.document_loaders.csv_loader", "CSVLoader", {"encoding": "utf-8"}, [])
 }
 
 WEB_URL_LOAD_TARGETS = [
@@ -87,6 +113,74 @@ CHUNK_SIZE: int = 1000
 CHUNK_OVERLAP: int = 100
 TOP_K_DOCUMENTS: int = 5
 
+# ------------------------------------------
+# メタデータによる絞り込み設定
+# ------------------------------------------
+# 「MTG議事録」配下で、顧客ごとの議事録をまとめているフォルダ名
+CUSTOMER_FOLDER_NAME = "顧客"
+# 転置インデックスを作成するメタデータ項目
+INDEXED_METADATA_FIELDS = ["category", "customer_status", "company", "department", "doc_type", "date"]
+# 入力内容に含まれる会社名の判定時に、省略されていても一致とみなす法人格
+COMPANY_LEGAL_SUFFIXES = ["株式会社", "合同会社", "有限会社"]
+# 入力内容にフォルダ名そのもの、またはキーワードが CATEGORY_KEYWORD_MIN_MATCHES 個以上含まれる場合、
+# 検索対象をそのカテゴリ（フォルダ）に絞り込む（「環境」など一般的な1語だけでは絞り込まない）
+CATEGORY_KEYWORD_MIN_MATCHES = 2
+CATEGORY_KEYWORDS = {
+    "MTG議事録": ["議事録", "ミーティング", "MTG", "会議"],
+    "サービスについて": ["サービス", "製品", "商品", "EcoTee"],
+    "社員について": ["社員", "従業員", "名簿"],
+    "会社について": ["会社概要", "株主", "環境"],
+    "顧客について": ["お客様", "顧客情報"],
+}
+
+# ------------------------------------------
+# 起動モード設定
+# ------------------------------------------
+# 作成済みのベクターストアの保存先（「python initialize.py」で作成）
+VECTORSTORE_PERSIST_DIR = "./vectorstore"
+# この環境変数が「1」の場合、インジェストを行わず作成済みのベクターストアから起動する
+SERVE_ONLY_ENV_NAME = "SERVE_ONLY"
+# 「python startup.py」でインポート時間を計測するモジュール
+STARTUP_PROFILE_MODULES = [
+    "streamlit",
+    "langchain_openai",
+    "langchain_community.vectorstores.chroma",
+    "chromadb",
+    "langchain_community.document_loaders.pdf",
+    "langchain_community.document_loaders.word_document",
+    "langchain_community.document_loaders.csv_loader",
+    "langchain_community.document_loaders.web_base",
+    "langchain.text_splitter",
+    "langchain.retrievers.multi_query",
+    "fitz",
+    "docx2txt",
+    "bs4",
+]
+
+# ------------------------------------------
+# 重複排除設定
+# ------------------------------------------
+# ヘッダー・フッター判定の対象とする最小ページ数
+DEDUP_BOILERPLATE_MIN_PAGES: int = 3
+# この割合以上のページに登場する行をヘッダー・フッターとみなす
+DEDUP_BOILERPLATE_PAGE_RATIO: float = 0.6
+# ヘッダー・フッターとみなす行の最大文字数（本文の誤削除を防ぐ）
+DEDUP_BOILERPLATE_MAX_LINE_LENGTH: int = 80
+# ヘッダー・フッターとみなす行の、句読点を除いた最小文字数（ページ番号の行を除く）
+DEDUP_BOILERPLATE_MIN_TEXT_LENGTH: int = 4
+# ヘッダー・フッターの判定対象とする、各ページの先頭・末尾の行数
+DEDUP_BOILERPLATE_EDGE_LINES: int = 2
+# 文字シングルの長さ（日本語は単語区切りがないため文字単位）
+DEDUP_SHINGLE_SIZE: int = 5
+# MinHashシグネチャの長さ
+DEDUP_NUM_PERM: int = 128
+# LSHの帯の数（DEDUP_NUM_PERMを割り切れる値）
+DEDUP_LSH_BANDS: int = 32
+# この推定Jaccard類似度以上のチャンクを重複とみなす
+DEDUP_SIMILARITY_THRESHOLD: float = 0.8
+# これらのメタデータ（フォルダ由来）がすべて同じチャンク同士のみを統合する
+DEDUP_SCOPE_FIELDS = ["category", "customer_status", "company", "department"]
+
 
 # ==========================================
 # プロンプトテンプレート
@@ -134,10 +228,13 @@ NO_DOC_MATCH_ANSWER = "該当資料なし"
 # ==========================================
 COMMON_ERROR_MESSAGE = "このエラーが繰り返し発生する場合は、管理者にお問い合わせください。"
 INITIALIZE_ERROR_MESSAGE = "初期化処理に失敗しました。"
+VECTORSTORE_NOT_FOUND_MESSAGE = "作成済みのベクターストアが見つかりません。「python initialize.py」で作成してください。"
 NO_DOC_MATCH_MESSAGE = """
     入力内容と関連する社内文書が見つかりませんでした。\n
     入力内容を変更してください。
 """
 CONVERSATION_LOG_ERROR_MESSAGE = "過去の会話履歴の表示に失敗しました。"
 GET_LLM_RESPONSE_ERROR_MESSAGE = "回答生成に失敗しました。"
-DISP_ANSWER_ERROR_MESSAGE = "回答表示に失敗しました。"
\ No newline at end of file
+DISP_ANSWER_ERROR_MESSAGE = "回答表示に失敗しました。"
+SESSION_TOKEN_BUDGET_EXCEEDED_MESSAGE = "このセッションで利用できる上限に達しました。ページを再読み込みしてください。"
+DAILY_TOKEN_BUDGET_EXCEEDED_MESSAGE = "本日利用できる上限に達しました。明日以降に再度お試しください。"
\ No newline at end of file
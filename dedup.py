@@ -0,0 +1,312 @@
+"""
+このファイルは、ベクターストア作成前にドキュメントの重複を取り除く処理が記述されたファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import re
+import json
+import hashlib
+import logging
+from collections import defaultdict
+import constants as ct
+
+
+############################################################
+# 変数定義
+############################################################
+# ページ番号だけの行（例: 「- 3 -」「3 / 10」「p.3」「3ページ」「（3）」）
+_PAGE_NUMBER_LINE_PATTERN = re.compile(
+    r"[-－‐]\s*\d+\s*[-－‐]"
+    r"|\d+\s*[/／]\s*\d+"
+    r"|(?:p\.?|page)\s*\d+"
+    r"|\d+\s*(?:ページ|頁)"
+    r"|[(（]\s*\d+\s*[)）]",
+    re.IGNORECASE,
+)
+# 数字だけの行（ページの先頭・末尾にある場合のみページ番号とみなす）
+_BARE_NUMBER_LINE_PATTERN = re.compile(r"\d+")
+# 句読点・記号・空白（ヘッダー・フッター判定時の文字数に含めない）
+_PUNCTUATION_PATTERN = re.compile(r"[\W_]+")
+
+
+############################################################
+# 関数定義
+############################################################
+
+def strip_page_boilerplate(docs):
+    """
+    PDFなどのページ単位のドキュメントから、各ページで繰り返されるヘッダー・フッターを取り除く
+
+    CSVの行など、ページ番号を持たないドキュメントは対象外です
+    （同じ項目名の行が全レコードに登場するため、本文を誤って削除してしまうため）。
+
+    Args:
+        docs: ファイル読み込み直後のドキュメントのリスト
+
+    Returns:
+        取り除いた行数
+    """
+    # ファイルごとにページをまとめる
+    pages_by_source = defaultdict(list)
+    for doc in docs:
+        if "page" not in doc.metadata or "row" in doc.metadata:
+            continue
+        pages_by_source[doc.metadata.get("source")].append(doc)
+
+    removed_line_count = 0
+    for pages in pages_by_source.values():
+        if len(pages) < ct.DEDUP_BOILERPLATE_MIN_PAGES:
+            continue
+
+        # 各ページの先頭・末尾の数行だけを対象に、何ページに登場するかを数える
+        # （本文の途中で折り返された短い行を、ヘッダー・フッターと誤判定しないため）
+        line_page_counts = defaultdict(int)
+        for page in pages:
+            lines = page.page_content.splitlines()
+            edge_lines = {_normalize_boilerplate_line(lines[i]) for i in _edge_line_indexes(lines)}
+            for line in edge_lines:
+                if line:
+                    line_page_counts[line] += 1
+
+        threshold = len(pages) * ct.DEDUP_BOILERPLATE_PAGE_RATIO
+        boilerplate_lines = {
+            line for line, count in line_page_counts.items()
+            if count >= threshold and _is_boilerplate_candidate(line)
+        }
+        if not boilerplate_lines:
+            continue
+
+        for page in pages:
+            lines = page.page_content.splitlines()
+            removed_indexes = {
+                i for i in _edge_line_indexes(lines)
+                if _normalize_boilerplate_line(lines[i]) in boilerplate_lines
+            }
+            removed_line_count += len(removed_indexes)
+            page.page_content = "\n".join(
+                line for i, line in enumerate(lines) if i not in removed_indexes
+            )
+
+    return removed_line_count
+
+
+def deduplicate_chunks(chunks):
+    """
+    MinHash/LSHでほぼ同一内容のチャンクを検出し、代表となるチャンクのみを残す
+
+    フォルダ由来のメタデータ（ct.DEDUP_SCOPE_FIELDS）が同じチャンク同士のみを統合します。
+    （別の顧客の議事録の定型的な締めの挨拶などを統合し、検索範囲の絞り込みや
+    ありかの表示で別の顧客のファイルが混ざるのを防ぐため）
+
+    Args:
+        chunks: チャンク分割後のドキュメントのリスト
+
+    Returns:
+        重複を取り除いたチャンクのリスト
+    """
+    signatures = [_minhash_signature(chunk.page_content) for chunk in chunks]
+
+    # LSH: シグネチャを帯に分け、同じ検索範囲かつ同じバケットに入ったものを候補ペアとする
+    rows = ct.DEDUP_NUM_PERM // ct.DEDUP_LSH_BANDS
+    buckets = defaultdict(list)
+    for i, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        scope = tuple(chunks[i].metadata.get(field) for field in ct.DEDUP_SCOPE_FIELDS)
+        for band in range(ct.DEDUP_LSH_BANDS):
+            band_values = tuple(signature[band * rows:(band + 1) * rows])
+            buckets[(scope, band, band_values)].append(i)
+
+    # 候補ペアの推定Jaccard類似度が閾値以上であれば同じグループにまとめる
+    parents = list(range(len(chunks)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    checked_pairs = set()
+    for members in buckets.values():
+        for a_index, a in enumerate(members):
+            for b in members[a_index + 1:]:
+                if (a, b) in checked_pairs:
+                    continue
+                checked_pairs.add((a, b))
+                if _estimate_jaccard(signatures[a], signatures[b]) >= ct.DEDUP_SIMILARITY_THRESHOLD:
+                    root_a, root_b = find(a), find(b)
+                    if root_a != root_b:
+                        # 先に読み込んだチャンクを代表とする
+                        parents[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = defaultdict(list)
+    for i in range(len(chunks)):
+        groups[find(i)].append(i)
+
+    deduplicated_chunks = []
+    for i, chunk in enumerate(chunks):
+        if find(i) != i:
+            continue
+        members = groups[i]
+        if len(members) > 1:
+            # 代表チャンクに、重複していたすべてのありかを記録する
+            # （Chromaのメタデータはリストを保持できないため、JSON文字列で格納）
+            sources = []
+            for member in members:
+                location = {"source": chunks[member].metadata.get("source")}
+                if "page" in chunks[member].metadata:
+                    location["page"] = chunks[member].metadata["page"]
+                if location not in sources:
+                    sources.append(location)
+            chunk.metadata["sources"] = json.dumps(sources, ensure_ascii=False)
+        deduplicated_chunks.append(chunk)
+
+    return deduplicated_chunks
+
+
+def build_dedup_report(chunks_before, chunks_after, removed_line_count):
+    """
+    重複排除によってインデックスがどれだけ縮小したかをまとめる
+
+    Args:
+        chunks_before: 重複排除前のチャンクのリスト
+        chunks_after: 重複排除後のチャンクのリスト
+        removed_line_count: 取り除いたヘッダー・フッターの行数
+
+    Returns:
+        縮小結果をまとめた辞書
+    """
+    chars_before = sum(len(chunk.page_content) for chunk in chunks_before)
+    chars_after = sum(len(chunk.page_content) for chunk in chunks_after)
+    return {
+        "chunks_before": len(chunks_before),
+        "chunks_after": len(chunks_after),
+        "chunks_removed": len(chunks_before) - len(chunks_after),
+        "chars_before": chars_before,
+        "chars_after": chars_after,
+        "reduction_rate": round(1 - chars_after / chars_before, 4) if chars_before else 0.0,
+        "boilerplate_lines_removed": removed_line_count,
+    }
+
+
+def format_dedup_report(report):
+    """
+    重複排除の結果を、コマンドライン表示用の文字列に整形
+    """
+    return (
+        f"重複排除: チャンク数 {report['chunks_before']} → {report['chunks_after']}"
+        f"（{report['chunks_removed']}件削除）、"
+        f"文字数 {report['chars_before']} → {report['chars_after']}"
+        f"（{report['reduction_rate']:.1%}削減）、"
+        f"ヘッダー・フッター {report['boilerplate_lines_removed']}行削除"
+    )
+
+
+def log_dedup_report(report):
+    """
+    重複排除の結果をログに出力
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    logger.info({"dedup_report": report})
+
+
+def _edge_line_indexes(lines):
+    """
+    ページの先頭・末尾 ct.DEDUP_BOILERPLATE_EDGE_LINES 行（空行を除く）の行番号を返す
+    """
+    non_empty_indexes = [i for i, line in enumerate(lines) if line.strip()]
+    edge = ct.DEDUP_BOILERPLATE_EDGE_LINES
+    return set(non_empty_indexes[:edge]) | set(non_empty_indexes[-edge:])
+
+
+def _normalize_boilerplate_line(line):
+    """
+    ヘッダー・フッター判定用に行を正規化
+
+    前後の空白を除き、ページ番号だけの行に限り数字を同一視します。
+    （この関数はページの先頭・末尾の行にのみ使うため、数字だけの行もページ番号とみなす）
+    """
+    line = line.strip()
+    if _is_page_number_line(line):
+        return re.sub(r"\d+", "#", line)
+    return line
+
+
+def _is_page_number_line(line):
+    """
+    ページ番号だけの行かどうかを判定
+    """
+    return bool(_PAGE_NUMBER_LINE_PATTERN.fullmatch(line) or _BARE_NUMBER_LINE_PATTERN.fullmatch(line))
+
+
+def _is_boilerplate_candidate(normalized_line):
+    """
+    正規化済みの行が、ヘッダー・フッターとして削除してよい形かどうかを判定
+
+    ページ番号の行か、句読点を除いて ct.DEDUP_BOILERPLATE_MIN_TEXT_LENGTH 文字以上
+    ct.DEDUP_BOILERPLATE_MAX_LINE_LENGTH 文字以下の行のみを対象とします（「入。」のような
+    文末の折り返しを除外するため）。
+    """
+    if _is_page_number_line(normalized_line.replace("#", "0")):
+        return True
+    text_length = len(_PUNCTUATION_PATTERN.sub("", normalized_line))
+    return (
+        ct.DEDUP_BOILERPLATE_MIN_TEXT_LENGTH <= text_length
+        and len(normalized_line) <= ct.DEDUP_BOILERPLATE_MAX_LINE_LENGTH
+    )
+
+
+def _shingles(text):
+    """
+    空白を詰めたテキストから文字単位のシングルを作成
+    """
+    text = re.sub(r"\s+", " ", text).strip()
+    size = ct.DEDUP_SHINGLE_SIZE
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _minhash_signature(text):
+    """
+    One Permutation Hashingによる MinHash シグネチャを作成
+
+    シングルごとにハッシュを1回だけ計算し、ビンごとの最小値をシグネチャとするため、
+    純粋なPythonでも十分高速に動作します。
+    """
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+
+    num_perm = ct.DEDUP_NUM_PERM
+    bins = [None] * num_perm
+    for shingle in shingles:
+        hash_value = int.from_bytes(
+            hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        index, value = hash_value % num_perm, hash_value // num_perm
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+
+    # 空のビンは右隣の空でないビンの値で埋める（densification）
+    for i in range(num_perm):
+        if bins[i] is not None:
+            continue
+        for offset in range(1, num_perm):
+            neighbor = bins[(i + offset) % num_perm]
+            if neighbor is not None:
+                bins[i] = neighbor
+                break
+
+    return bins
+
+
+def _estimate_jaccard(signature_a, signature_b):
+    """
+    2つのシグネチャの一致率からJaccard類似度を推定
+    """
+    matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return matches / len(signature_a)
+
@@ -9,6 +9,7 @@ sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 # ライブラリの読み込み
 ############################################################
 import os
+import shutil
 import logging
 from logging.handlers import TimedRotatingFileHandler
 from uuid import uuid4
@@ -16,15 +17,13 @@ import sys
 import unicodedata
 from dotenv import load_dotenv
 import streamlit as st
-from docx import Document
-from langchain_community.document_loaders import WebBaseLoader
-# ▼▼▼【修正箇所】CharacterTextSplitter ではなく RecursiveCharacterTextSplitter を推奨します ▼▼▼
-# 多くのドキュメントタイプでより安定して動作するためです。もしCharacterTextSplitterを使い続ける場合はそのままでOKです。
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-# ▲▲▲【修正箇所】ここまで ▲▲▲
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
+# 読み込み・分割・ベクターストア関連のライブラリは、起動時間短縮のため
+# 使用する関数の中で startup.timed_import / startup.timed_getattr により遅延インポートする
 import constants as ct
+import dedup
+import metadata_index
+import startup
+import token_usage
 
 
 ############################################################
@@ -85,19 +84,73 @@ def initialize_retriever():
 
     if "retriever" in st.session_state:
         return
-    
+
+    if is_serve_only():
+        # 作成済みのベクターストアから起動（ファイル読み込み・分割は行わない）
+        db = load_vectorstore()
+    else:
+        # ベクターストア作成時の埋め込みのトークン数は、1日単位の集計とログにのみ含める
+        # （コーパス全体の分をセッションの上限に含めると、最初の質問の前に上限に達してしまうため）
+        recorder = token_usage.start_recording()
+        try:
+            db, _ = build_vectorstore()
+        finally:
+            # 途中で失敗した場合も、それまでに使用したトークン数を集計
+            token_usage.stop_recording()
+            daily_tokens = token_usage.add_to_daily(recorder)
+            token_usage.log_usage(recorder, None, daily_tokens)
+
+    # ▼▼▼【修正箇所 2/2】Retrieverの検索パラメータを定数に置き換え ▼▼▼
+    # ベクターストアを検索するRetrieverの作成
+    st.session_state.retriever = db.as_retriever(search_kwargs={"k": ct.TOP_K_DOCUMENTS})
+    # ▲▲▲【修正箇所】ここまで ▲▲▲
+    # 検索範囲を絞り込んだRetrieverを作成するため、ベクターストア本体も保持
+    st.session_state.vectorstore = db
+    # フォルダ由来のメタデータの転置インデックスを作成
+    st.session_state.metadata_index = metadata_index.build_metadata_index(db)
+
+    # 遅延インポートにかかった時間をログ出力（起動時間の悪化を追跡するため）
+    startup.log_import_times()
+
+
+def is_serve_only():
+    """
+    作成済みのベクターストアから起動するモードかどうかを判定
+    """
+    return os.getenv(ct.SERVE_ONLY_ENV_NAME) == "1"
+
+
+def build_vectorstore(persist_directory=None):
+    """
+    データソースを読み込み、チャンク分割してベクターストアを作成
+
+    Args:
+        persist_directory: ベクターストアの保存先（省略時はメモリ上にのみ作成）
+
+    Returns:
+        作成したベクターストアと、重複排除の結果をまとめた辞書
+    """
+    text_splitter_class = startup.timed_getattr("langchain.text_splitter", "RecursiveCharacterTextSplitter")
+    chroma_class = _import_chroma()
+    embeddings_class = startup.timed_getattr("langchain_openai", "OpenAIEmbeddings")
+
     docs_all = load_data_sources()
 
     for doc in docs_all:
         doc.page_content = adjust_string(doc.page_content)
         for key in doc.metadata:
             doc.metadata[key] = adjust_string(doc.metadata[key])
+
+    # 各ページで繰り返されるヘッダー・フッターを除去
+    removed_line_count = dedup.strip_page_boilerplate(docs_all)
     
-    embeddings = OpenAIEmbeddings()
+    embeddings = token_usage.TokenCountingEmbeddings(
+        embeddings_class(model=ct.EMBEDDING_MODEL), ct.EMBEDDING_MODEL
+    )
     
     # ▼▼▼【修正箇所 1/2】チャンク分割のパラメータを定数に置き換え ▼▼▼
     # チャンク分割用のオブジェクトを作成
-    text_splitter = RecursiveCharacterTextSplitter( # 推奨のSplitterに変更
+    text_splitter = text_splitter_class( # 推奨のSplitterに変更
         chunk_size=ct.CHUNK_SIZE,
         chunk_overlap=ct.CHUNK_OVERLAP,
     )
@@ -105,12 +158,48 @@ def initialize_retriever():
 
     splitted_docs = text_splitter.split_documents(docs_all)
 
-    db = Chroma.from_documents(splitted_docs, embedding=embeddings)
+    # PDFとWordの議事録など、ファイルをまたいでほぼ同一内容のチャンクを1つにまとめる
+    deduplicated_docs = dedup.deduplicate_chunks(splitted_docs)
+    dedup_report = dedup.build_dedup_report(splitted_docs, deduplicated_docs, removed_line_count)
+    dedup.log_dedup_report(dedup_report)
+    splitted_docs = deduplicated_docs
 
-    # ▼▼▼【修正箇所 2/2】Retrieverの検索パラメータを定数に置き換え ▼▼▼
-    # ベクターストアを検索するRetrieverの作成
-    st.session_state.retriever = db.as_retriever(search_kwargs={"k": ct.TOP_K_DOCUMENTS})
-    # ▲▲▲【修正箇所】ここまで ▲▲▲
+    db = chroma_class.from_documents(
+        splitted_docs, embedding=embeddings, persist_directory=persist_directory
+    )
+    return db, dedup_report
+
+
+def load_vectorstore():
+    """
+    「python initialize.py」で作成済みのベクターストアを読み込む
+
+    Returns:
+        読み込んだベクターストア
+    """
+    if not os.path.isdir(ct.VECTORSTORE_PERSIST_DIR):
+        raise FileNotFoundError(ct.VECTORSTORE_NOT_FOUND_MESSAGE)
+
+    chroma_class = _import_chroma()
+    embeddings_class = startup.timed_getattr("langchain_openai", "OpenAIEmbeddings")
+
+    return chroma_class(
+        persist_directory=ct.VECTORSTORE_PERSIST_DIR,
+        embedding_function=token_usage.TokenCountingEmbeddings(
+            embeddings_class(model=ct.EMBEDDING_MODEL), ct.EMBEDDING_MODEL
+        ),
+    )
+
+
+def _import_chroma():
+    """
+    Chromaクラスを遅延インポート
+
+    chromadb本体はChromaの作成時に初めて読み込まれるため、インポート時間を計測できるよう先に読み込む
+    """
+    chroma_class = startup.timed_getattr("langchain_community.vectorstores.chroma", "Chroma")
+    startup.timed_import("chromadb")
+    return chroma_class
 
 
 def initialize_session_state():
@@ -118,6 +207,8 @@ def initialize_session_state():
     if "messages" not in st.session_state:
         st.session_state.messages = []
         st.session_state.chat_history = []
+    if "token_usage" not in st.session_state:
+        st.session_state.token_usage = token_usage.new_session_usage()
 
 
 def load_data_sources():
@@ -125,8 +216,12 @@ def load_data_sources():
     docs_all = []
     recursive_file_check(ct.RAG_TOP_FOLDER_PATH, docs_all)
     web_docs_all = []
+    if ct.WEB_URL_LOAD_TARGETS:
+        web_loader_class = startup.timed_getattr("langchain_community.document_loaders.web_base", "WebBaseLoader")
+        # WebBaseLoaderが内部で使うHTML解析ライブラリも、インポート時間を計測できるよう先に読み込む
+        startup.timed_import("bs4")
     for web_url in ct.WEB_URL_LOAD_TARGETS:
-        loader = WebBaseLoader(web_url)
+        loader = web_loader_class(web_url)
         web_docs = loader.load()
         web_docs_all.extend(web_docs)
     docs_all.extend(web_docs_all)
@@ -149,8 +244,18 @@ def file_load(path, docs_all):
     file_extension = os.path.splitext(path)[1]
     file_name = os.path.basename(path)
     if file_extension in ct.SUPPORTED_EXTENSIONS:
-        loader = ct.SUPPORTED_EXTENSIONS[file_extension](path)
+        # 拡張子に対応するローダーを、初めて使う時点でインポート
+        module_name, class_name, loader_kwargs, backend_modules = ct.SUPPORTED_EXTENSIONS[file_extension]
+        loader_class = startup.timed_getattr(module_name, class_name)
+        # ローダーが読み込み時に初めて使うライブラリ（PDF解析など）も、インポート時間を計測できるよう先に読み込む
+        for backend_module in backend_modules:
+            startup.timed_import(backend_module)
+        loader = loader_class(path, **loader_kwargs)
         docs = loader.load()
+        # フォルダ構成から導出したメタデータ（カテゴリ、会社名など）を付与
+        derived_metadata = metadata_index.derive_metadata(path)
+        for doc in docs:
+            doc.metadata.update(derived_metadata)
         docs_all.extend(docs)
 
 
@@ -162,4 +267,33 @@ def adjust_string(s):
         s = unicodedata.normalize('NFC', s)
         s = s.encode("cp932", "ignore").decode("cp932")
         return s
-    return s
\ No newline at end of file
+    return s
+
+
+if __name__ == "__main__":
+    # 「python initialize.py」で実行すると、ベクターストアを作成して保存する
+    # （環境変数 SERVE_ONLY=1 で起動したアプリはこのベクターストアを読み込む）
+    # 作成に失敗しても前回のベクターストアが残るよう、一時フォルダに作成してから置き換える
+    # （一時フォルダは毎回空にして、チャンクが重複登録されないようにする）
+    build_directory = f"{ct.VECTORSTORE_PERSIST_DIR}.tmp"
+    previous_directory = f"{ct.VECTORSTORE_PERSIST_DIR}.old"
+    shutil.rmtree(build_directory, ignore_errors=True)
+    recorder = token_usage.start_recording()
+    try:
+        _, dedup_report = build_vectorstore(persist_directory=build_directory)
+    finally:
+        token_usage.stop_recording()
+
+    # os.replace は空でないフォルダを上書きできないため、既存のものを退避してから置き換える
+    shutil.rmtree(previous_directory, ignore_errors=True)
+    if os.path.exists(ct.VECTORSTORE_PERSIST_DIR):
+        os.replace(ct.VECTORSTORE_PERSIST_DIR, previous_directory)
+    os.replace(build_directory, ct.VECTORSTORE_PERSIST_DIR)
+    shutil.rmtree(previous_directory, ignore_errors=True)
+
+    # 「python initialize.py」ではログファイルの設定を行わないため、結果は標準出力に表示
+    print(dedup.format_dedup_report(dedup_report))
+    for module_name, seconds in startup.IMPORT_TIMES.items():
+        print(f"インポート時間: {module_name}: {seconds:.3f}s")
+    usage = recorder.total()
+    print(f"埋め込みトークン数: {usage['prompt_tokens']}（約{usage['cost_usd']:.4f}ドル）")
@@ -0,0 +1,309 @@
+"""
+このファイルは、複数のセッションを保持した状態でのアプリの性能を計測する負荷試験ツールです。
+
+Streamlitのヘッドレスなテスト機能（AppTest）で「main.py」を実行し、1つのプロセス内で
+セッションを1つずつ追加しながら（追加済みのセッションは破棄せずに保持）、質問1件あたりの
+応答時間のパーセンタイルと、セッションあたりのメモリ使用量を計測します。
+OpenAIのモデルは、応答時間を指定できる偽物（フェイク）に差し替えるため、APIキーは不要です。
+
+AppTestはプロセス全体で共有するStreamlitのRuntimeを実行のたびに作成・破棄するため、
+1つのプロセス内では同時に実行できません。そのため、各セッションの質問は順番に実行しており、
+計測値は「同時に何人まで利用できるか」の目安ではありません。
+同時接続数の上限を求めるには、フェイクを組み込んだ「streamlit run main.py」のサーバー1つに
+複数のブラウザ（WebSocket）クライアントから接続して計測する必要があります。
+
+実行例:
+    python load_test.py --sessions 16 --requests-per-session 4 --llm-latency 0.8 --embedding-latency 0.05
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import sys
+import time
+import json
+import hashlib
+import argparse
+import functools
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from streamlit.testing.v1 import AppTest
+import constants as ct
+
+
+############################################################
+# 変数定義
+############################################################
+MAIN_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# 模擬ユーザーが送信する質問（モードと入力内容の組み合わせ）
+QUESTION_MIX = [
+    (ct.ANSWER_MODE_1, "社員の育成方針に関するMTGの議事録"),
+    (ct.ANSWER_MODE_2, "人事部に所属している従業員情報を一覧化して"),
+    (ct.ANSWER_MODE_1, "フォーカスゲート株式会社との打ち合わせ内容"),
+    (ct.ANSWER_MODE_2, "EcoTee Creatorの利用方法を教えて"),
+    (ct.ANSWER_MODE_1, "株主優待に関する資料"),
+    (ct.ANSWER_MODE_2, "代行出荷サービスの料金体系について教えて"),
+]
+
+# 応答時間の悪化とみなす、最初の計測区間のp95に対する倍率
+DEFAULT_DEGRADATION_FACTOR = 2.0
+
+
+############################################################
+# フェイクのモデル定義
+############################################################
+
+class FakeChatModel(BaseChatModel):
+    """
+    指定した時間だけ待ってから固定の回答を返すチャットモデル
+    """
+    latency: float = 0.0
+    temperature: float = 0.0
+    model: str = "fake-chat-model"
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        # MultiQueryRetrieverが複数の検索クエリとして扱えるよう、複数行で返す
+        text = "社内文書に関する質問\n社内資料の検索"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    指定した時間だけ待ってから、テキストのハッシュ値に基づくベクトルを返す埋め込みモデル
+    """
+    dimension = 64
+
+    def __init__(self, latency=0.0, **kwargs):
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    def _embed(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255 for i in range(self.dimension)]
+
+
+############################################################
+# 関数定義
+############################################################
+
+def install_fakes(llm_latency, embedding_latency):
+    """
+    OpenAIのモデルをフェイクに差し替え、Webページの読み込みを無効化する
+    """
+    import langchain_openai
+    import utils
+
+    fake_chat_model = functools.partial(FakeChatModel, latency=llm_latency)
+    fake_embeddings = functools.partial(FakeEmbeddings, latency=embedding_latency)
+
+    langchain_openai.ChatOpenAI = fake_chat_model
+    langchain_openai.OpenAIEmbeddings = fake_embeddings
+    utils.ChatOpenAI = fake_chat_model
+    # 負荷試験が外部サイトへのアクセスに左右されないよう、Webページは読み込まない
+    ct.WEB_URL_LOAD_TARGETS = []
+
+
+def setup_environment(app_dir, llm_latency, embedding_latency, serve_only):
+    """
+    負荷試験を実行するプロセスの初期化（フェイクへの差し替えなど）
+    """
+    # main.py内の相対パス（./data、./logs）を解決できるよう、アプリのディレクトリで実行
+    os.chdir(app_dir)
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    if serve_only:
+        os.environ[ct.SERVE_ONLY_ENV_NAME] = "1"
+    install_fakes(llm_latency, embedding_latency)
+
+
+def run_session(session_index, requests_per_session, timeout):
+    """
+    1つのセッションとして、アプリの起動と質問の送信を行う
+
+    途中で例外が発生しても負荷試験全体は止めず、エラーとして件数に含めます。
+
+    Returns:
+        (計測結果の辞書, セッションを保持するAppTest)
+    """
+    result = {"startup_time": None, "latencies": [], "errors": 0}
+    app = None
+    try:
+        app = AppTest.from_file(MAIN_SCRIPT_PATH, default_timeout=timeout)
+
+        start = time.perf_counter()
+        app.run()
+        result["startup_time"] = time.perf_counter() - start
+        if app.exception:
+            result["errors"] += 1
+
+        for i in range(requests_per_session):
+            mode, question = QUESTION_MIX[(session_index + i) % len(QUESTION_MIX)]
+            app.sidebar.radio[0].set_value(mode)
+            app.chat_input[0].set_value(question)
+            start = time.perf_counter()
+            app.run()
+            result["latencies"].append(time.perf_counter() - start)
+            if app.exception or app.error:
+                result["errors"] += 1
+    except Exception:
+        result["errors"] += 1
+
+    return result, app
+
+
+def summarize_checkpoint(live_sessions, session_results, memory_mb, baseline_memory_mb):
+    """
+    前回の計測点以降に追加したセッションの結果と、現在のメモリ使用量をまとめる
+
+    Args:
+        live_sessions: 保持しているセッション数
+        session_results: 前回の計測点以降に追加したセッションの計測結果
+        memory_mb: すべてのセッションを保持した状態のメモリ使用量（MB）
+        baseline_memory_mb: セッション作成前のメモリ使用量（MB）
+    """
+    latencies = sorted(latency for result in session_results for latency in result["latencies"])
+    startup_times = sorted(
+        result["startup_time"] for result in session_results if result["startup_time"] is not None
+    )
+    return {
+        "live_sessions": live_sessions,
+        "requests": len(latencies),
+        "errors": sum(result["errors"] for result in session_results),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "startup_p50": round(percentile(startup_times, 50), 3),
+        "memory_mb": round(memory_mb, 1),
+        "memory_per_session_mb": round(max(memory_mb - baseline_memory_mb, 0) / live_sessions, 1),
+    }
+
+
+def percentile(sorted_values, p):
+    """
+    ソート済みの値から、最近傍順位法でパーセンタイル値を求める
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(len(sorted_values) * p / 100 + 0.5) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def current_memory_mb():
+    """
+    プロセスの現在のメモリ使用量（RSS）をMB単位で返す
+
+    /proc が使えない環境では、最大使用量で代用します。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOSはバイト単位、Linuxはキロバイト単位
+        return max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+
+
+def checkpoint_levels(max_sessions):
+    """
+    1, 2, 4, ... と倍々に増やし、最後に max_sessions を含む計測点（保持セッション数）のリストを返す
+    """
+    levels = []
+    level = 1
+    while level < max_sessions:
+        levels.append(level)
+        level *= 2
+    levels.append(max_sessions)
+    return levels
+
+
+def find_degradation_point(checkpoint_results, factor):
+    """
+    p95の応答時間が最初の計測点の factor 倍を超えた（またはエラーが発生した）最初の保持セッション数を返す
+    """
+    baseline = checkpoint_results[0]["latency_p95"]
+    for result in checkpoint_results[1:]:
+        if result["errors"] or result["latency_p95"] > baseline * factor:
+            return result["live_sessions"]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="セッションを保持した状態でのStreamlitアプリの負荷試験")
+    parser.add_argument("--sessions", type=int, default=8, help="保持するセッション数の最大値")
+    parser.add_argument("--requests-per-session", type=int, default=3, help="1セッションあたりの質問数")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="フェイクLLMの応答時間（秒）")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="フェイク埋め込みの応答時間（秒）")
+    parser.add_argument("--degradation-factor", type=float, default=DEFAULT_DEGRADATION_FACTOR)
+    parser.add_argument("--timeout", type=float, default=300, help="1回のスクリプト実行のタイムアウト（秒）")
+    parser.add_argument("--serve-only", action="store_true", help="作成済みのベクターストアから起動する")
+    parser.add_argument("--json", help="計測結果をJSONで保存するファイルパス")
+    args = parser.parse_args()
+
+    setup_environment(
+        os.path.dirname(MAIN_SCRIPT_PATH), args.llm_latency, args.embedding_latency, args.serve_only
+    )
+    baseline_memory_mb = current_memory_mb()
+
+    # 計測中はすべてのセッションを破棄せずに保持し、実際のセッションあたりのメモリを計測する
+    live_apps = []
+    pending_results = []
+    checkpoint_results = []
+    checkpoints = set(checkpoint_levels(args.sessions))
+    for session_index in range(args.sessions):
+        result, app = run_session(session_index, args.requests_per_session, args.timeout)
+        live_apps.append(app)
+        pending_results.append(result)
+        if len(live_apps) not in checkpoints:
+            continue
+
+        checkpoint = summarize_checkpoint(
+            len(live_apps), pending_results, current_memory_mb(), baseline_memory_mb
+        )
+        checkpoint_results.append(checkpoint)
+        pending_results = []
+        print(
+            f"live_sessions={checkpoint['live_sessions']:>3} requests={checkpoint['requests']:>4} "
+            f"errors={checkpoint['errors']:>3} "
+            f"p50={checkpoint['latency_p50']:.3f}s p95={checkpoint['latency_p95']:.3f}s "
+            f"p99={checkpoint['latency_p99']:.3f}s startup_p50={checkpoint['startup_p50']:.3f}s "
+            f"memory={checkpoint['memory_mb']:.1f}MB (+{checkpoint['memory_per_session_mb']:.1f}MB/session)"
+        )
+
+    print("※ 各セッションの質問は1つのプロセス内で順番に実行した値であり、同時接続数の上限の目安ではありません。")
+    degradation_point = find_degradation_point(checkpoint_results, args.degradation_factor)
+    if degradation_point is None:
+        print(f"保持セッション数 {args.sessions} まで応答時間の悪化は見られませんでした。")
+    else:
+        print(
+            f"保持セッション数 {degradation_point} で応答時間が悪化しました"
+            f"（p95が{args.degradation_factor}倍超、またはエラー発生）。"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"checkpoints": checkpoint_results, "degradation_point": degradation_point},
+                f, ensure_ascii=False, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,8 @@ from initialize import initialize
 import components as cn
 # （自作）変数（定数）がまとめて定義・管理されているモジュール
 import constants as ct
+# （自作）トークン数・料金の集計と利用上限の管理を行うモジュール
+import token_usage
 
 # ===== Streamlit Cloudでのログ出力設定 =====
 import sys
@@ -123,6 +125,12 @@ if chat_message:
         try:
             # 画面読み込み時に作成したRetrieverを使い、Chainを実行
             llm_response = utils.get_llm_response(chat_message)
+        except token_usage.TokenBudgetExceededError as e:
+            # トークン数の上限超過はエラーではないため、警告として表示
+            logger.warning(str(e))
+            st.warning(str(e), icon=ct.WARNING_ICON)
+            # 後続の処理を中断
+            st.stop()
         except Exception as e:
             # エラーログの出力（exc_info=TrueでTracebackも出力）
             logger.error(f"{ct.GET_LLM_RESPONSE_ERROR_MESSAGE}", exc_info=True)
@@ -0,0 +1,194 @@
+"""
+このファイルは、フォルダ構成から導出したメタデータと、それを使った検索範囲の絞り込み処理が記述されたファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import re
+import datetime
+import unicodedata
+from collections import defaultdict
+import constants as ct
+
+
+############################################################
+# 関数定義
+############################################################
+
+def derive_metadata(path):
+    """
+    「./data」配下のフォルダ構成から、ファイルのメタデータを導出
+
+    例: ./data/MTG議事録/顧客/既存/<会社名>/<会社名>.pdf
+        → category=MTG議事録, customer_status=既存, company=<会社名>, doc_type=pdf
+
+    Args:
+        path: 読み込むファイルのパス
+
+    Returns:
+        メタデータの辞書（値を導出できなかった項目は含めない）
+    """
+    relative_path = os.path.relpath(path, ct.RAG_TOP_FOLDER_PATH)
+    # macOSで作成されたフォルダ名は濁点が分離している場合があるため、NFCに統一
+    parts = [unicodedata.normalize("NFC", part) for part in relative_path.split(os.sep)]
+    folders, file_name = parts[:-1], parts[-1]
+
+    metadata = {}
+    if folders:
+        metadata["category"] = folders[0]
+    if len(folders) >= 4 and folders[1] == ct.CUSTOMER_FOLDER_NAME:
+        # MTG議事録/顧客/既存|見込み/<会社名>/
+        metadata["customer_status"] = folders[2]
+        metadata["company"] = folders[3]
+    elif len(folders) >= 2:
+        # MTG議事録/<部署名>/
+        metadata["department"] = folders[1]
+
+    file_extension = os.path.splitext(file_name)[1]
+    if file_extension:
+        metadata["doc_type"] = file_extension.lstrip(".").lower()
+
+    date = parse_date(file_name)
+    if date:
+        metadata["date"] = date
+
+    return metadata
+
+
+def parse_date(file_name):
+    """
+    ファイル名から日付を読み取り、「YYYY-MM-DD」形式で返す（読み取れない場合はNone）
+    """
+    match = re.search(r"(\d{4})[-_./年](\d{1,2})[-_./月](\d{1,2})", file_name)
+    if not match:
+        match = re.search(r"(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)", file_name)
+    if not match:
+        return None
+    try:
+        parsed_date = datetime.date(*(int(value) for value in match.groups()))
+    except ValueError:
+        return None
+    return parsed_date.isoformat()
+
+
+def build_metadata_index(db):
+    """
+    ベクターストアに登録済みのチャンクのメタデータから、転置インデックスを作成
+
+    Args:
+        db: ベクターストア
+
+    Returns:
+        {項目名: {値: チャンクIDの集合}} 形式の辞書
+    """
+    records = db.get(include=["metadatas"])
+    metadata_index = {field: defaultdict(set) for field in ct.INDEXED_METADATA_FIELDS}
+    for chunk_id, metadata in zip(records["ids"], records["metadatas"]):
+        for field in ct.INDEXED_METADATA_FIELDS:
+            value = (metadata or {}).get(field)
+            if value:
+                metadata_index[field][value].add(chunk_id)
+    return {field: dict(values) for field, values in metadata_index.items()}
+
+
+def build_search_filter(chat_message, search_scope, metadata_index):
+    """
+    サイドバーで選択された検索範囲と、入力内容に含まれる会社名・カテゴリから、
+    ベクター検索前に適用する絞り込み条件を作成
+
+    同じ項目内の複数の値はOR、異なる項目間はANDで結合します。
+    入力内容から推定した条件で該当チャンクがなくなる場合は、その条件を使いません。
+
+    Args:
+        chat_message: ユーザー入力値
+        search_scope: サイドバーで選択された検索範囲
+        metadata_index: build_metadata_index で作成した転置インデックス
+
+    Returns:
+        Chromaの「filter」引数に渡す条件（絞り込まない場合はNone）
+    """
+    conditions = {}
+    if search_scope and search_scope != ct.SEARCH_SCOPE_ALL:
+        conditions["category"] = [search_scope]
+
+    scope_ids = _matching_ids(conditions, metadata_index)
+
+    inferred_conditions = {}
+    companies = find_mentioned_companies(chat_message, metadata_index)
+    if companies:
+        inferred_conditions["company"] = companies
+    if "category" not in conditions:
+        categories = find_mentioned_categories(chat_message, metadata_index)
+        if categories:
+            inferred_conditions["category"] = categories
+
+    # 入力内容から推定した条件は、該当するチャンクが存在する場合のみ採用
+    if inferred_conditions:
+        inferred_ids = _matching_ids(inferred_conditions, metadata_index)
+        if scope_ids is not None and inferred_ids is not None:
+            inferred_ids &= scope_ids
+        if inferred_ids:
+            conditions.update(inferred_conditions)
+
+    return _to_chroma_filter(conditions)
+
+
+def find_mentioned_companies(chat_message, metadata_index):
+    """
+    入力内容に含まれる会社名を返す（「株式会社」などの法人格は省略されていても一致とみなす）
+    """
+    message = unicodedata.normalize("NFC", chat_message)
+    companies = []
+    for company in metadata_index.get("company", {}):
+        short_name = re.sub("|".join(ct.COMPANY_LEGAL_SUFFIXES), "", company)
+        if company in message or (short_name and short_name in message):
+            companies.append(company)
+    return companies
+
+
+def find_mentioned_categories(chat_message, metadata_index):
+    """
+    入力内容から、明確に言及されているカテゴリを返す
+
+    フォルダ名そのものが含まれる場合か、カテゴリのキーワードが
+    ct.CATEGORY_KEYWORD_MIN_MATCHES 個以上含まれる場合のみ該当とみなします。
+    """
+    message = unicodedata.normalize("NFC", chat_message)
+    categories = []
+    for category in metadata_index.get("category", {}):
+        matched_keywords = [
+            keyword for keyword in ct.CATEGORY_KEYWORDS.get(category, []) if keyword in message
+        ]
+        if category in message or len(matched_keywords) >= ct.CATEGORY_KEYWORD_MIN_MATCHES:
+            categories.append(category)
+    return categories
+
+
+def _matching_ids(conditions, metadata_index):
+    """
+    条件に該当するチャンクIDの集合を返す（条件がない場合はNone）
+    """
+    matched_ids = None
+    for field, values in conditions.items():
+        field_ids = set()
+        for value in values:
+            field_ids |= metadata_index.get(field, {}).get(value, set())
+        matched_ids = field_ids if matched_ids is None else matched_ids & field_ids
+    return matched_ids
+
+
+def _to_chroma_filter(conditions):
+    """
+    絞り込み条件をChromaのwhere句の形式に変換
+    """
+    clauses = [
+        {field: values[0]} if len(values) == 1 else {field: {"$in": values}}
+        for field, values in conditions.items()
+    ]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
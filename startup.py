@@ -0,0 +1,120 @@
+"""
+このファイルは、起動時間短縮のための遅延インポートと、インポート時間の計測処理が記述されたファイルです。
+
+「python startup.py」で実行すると、主要モジュールを新しいプロセスで1つずつインポートし、
+それぞれのインポート時間（コールドスタート時の値）を一覧表示します。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import sys
+import time
+import logging
+import importlib
+import subprocess
+import constants as ct
+
+
+############################################################
+# 変数定義
+############################################################
+# 遅延インポートしたモジュールごとのインポート時間（秒）
+IMPORT_TIMES = {}
+
+
+############################################################
+# 関数定義
+############################################################
+
+def timed_import(module_name):
+    """
+    モジュールを必要になった時点でインポートし、かかった時間を記録する
+
+    Args:
+        module_name: インポートするモジュール名
+
+    Returns:
+        インポートしたモジュール
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_TIMES[module_name] = round(time.perf_counter() - start, 4)
+    return module
+
+
+def timed_getattr(module_name, attr_name):
+    """
+    モジュールから属性（クラスなど）を取得し、かかった時間を記録する
+
+    langchain_community のように、属性へのアクセス時に初めて実体のモジュールを
+    読み込むパッケージもあるため、インポートとは別に計測します。
+
+    Args:
+        module_name: モジュール名
+        attr_name: 取得する属性名
+
+    Returns:
+        取得した属性
+    """
+    module = timed_import(module_name)
+    key = f"{module_name}.{attr_name}"
+    start = time.perf_counter()
+    value = getattr(module, attr_name)
+    if key not in IMPORT_TIMES:
+        IMPORT_TIMES[key] = round(time.perf_counter() - start, 4)
+    return value
+
+
+def log_import_times():
+    """
+    遅延インポートしたモジュールのインポート時間をログに出力
+    """
+    if not IMPORT_TIMES:
+        return
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    logger.info({"import_times": IMPORT_TIMES})
+
+
+def measure_cold_import_times(module_names=None):
+    """
+    モジュールごとに新しいPythonプロセスを起動し、コールドスタート時のインポート時間を計測する
+
+    「-X importtime」の出力から、対象モジュールの累積インポート時間を読み取ります。
+
+    Args:
+        module_names: 計測対象のモジュール名のリスト（省略時は ct.STARTUP_PROFILE_MODULES）
+
+    Returns:
+        モジュール名をキー、インポート時間（秒）を値とする辞書
+    """
+    if module_names is None:
+        module_names = ct.STARTUP_PROFILE_MODULES
+
+    results = {}
+    for module_name in module_names:
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            results[module_name] = None
+            continue
+        # 出力形式: "import time: self [us] | cumulative | imported package"
+        for line in completed.stderr.splitlines():
+            parts = [part.strip() for part in line.split("|")]
+            if len(parts) == 3 and parts[2] == module_name:
+                results[module_name] = int(parts[1]) / 1_000_000
+    return results
+
+
+if __name__ == "__main__":
+    for module_name, seconds in measure_cold_import_times().items():
+        if seconds is None:
+            print(f"{module_name}: インポート失敗")
+        else:
+            print(f"{module_name}: {seconds:.3f}s")
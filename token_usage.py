@@ -0,0 +1,359 @@
+"""
+このファイルは、モデル呼び出しごとのトークン数・料金を集計し、利用上限を管理する処理が記述されたファイルです。
+"""
+
+############################################################
+# ライブラリの読み込み
+############################################################
+import os
+import json
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import date
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+import constants as ct
+import startup
+
+# ファイルロック（Windowsにはfcntlがないため、msvcrtで代用）
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+############################################################
+# 変数定義
+############################################################
+# 処理中のリクエストのトークン数を記録するオブジェクト
+# （LangChainが並列実行に使うスレッドにも引き継がれるよう、ContextVarで保持）
+_current_recorder = contextvars.ContextVar("token_usage_recorder", default=None)
+
+# 1日単位の合計トークン数のファイルを、同じプロセス内のスレッド間で排他的に読み書きするためのロック
+# （プロセス間の排他はファイルロックで行う）
+_daily_lock = threading.Lock()
+
+# モデルごとのtiktokenのエンコーディング
+_encodings = {}
+
+
+############################################################
+# クラス定義
+############################################################
+
+class TokenBudgetExceededError(Exception):
+    """
+    セッションまたは1日あたりのトークン数の上限を超えた場合のエラー
+    """
+
+
+class UsageRecorder:
+    """
+    1リクエスト（または1回のベクターストア作成）で使用したトークン数を、処理段階ごとに記録する
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, model, prompt_tokens, completion_tokens=0, source="tiktoken"):
+        with self._lock:
+            usage = self.stages.setdefault(stage, _empty_usage())
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["cost_usd"] += calculate_cost(model, prompt_tokens, completion_tokens)
+            usage["sources"][source] = usage["sources"].get(source, 0) + 1
+
+    def total(self):
+        total = _empty_usage()
+        for usage in self.stages.values():
+            _merge_usage(total, usage)
+        return total
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """
+    チャットモデルの呼び出しごとに、入力・出力トークン数を記録するコールバック
+
+    OpenAIのレスポンスに使用量が含まれていればその値を、含まれていなければtiktokenで数えた値を使います。
+    """
+
+    def __init__(self, stage, model):
+        self.stage = stage
+        self.model = model
+        self._prompt_tokens = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        # メッセージごとのオーバーヘッド（役割名など）を含めた概算値
+        self._prompt_tokens[run_id] = sum(
+            count_tokens(str(message.content), self.model) + ct.TOKENS_PER_MESSAGE
+            for message_list in messages for message in message_list
+        ) + ct.TOKENS_PER_MESSAGE
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(count_tokens(prompt, self.model) for prompt in prompts)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        estimated_prompt_tokens = self._prompt_tokens.pop(run_id, 0)
+        recorder = _current_recorder.get()
+        if recorder is None:
+            return
+
+        provider_usage = _provider_usage(response)
+        if provider_usage:
+            recorder.add(self.stage, self.model, *provider_usage, source="provider")
+            return
+
+        completion_tokens = sum(
+            count_tokens(generation.text, self.model)
+            for generation_list in response.generations for generation in generation_list
+        )
+        recorder.add(self.stage, self.model, estimated_prompt_tokens, completion_tokens)
+
+
+class TokenCountingEmbeddings(Embeddings):
+    """
+    埋め込みモデルをラップし、ベクターストア作成時と検索時の入力トークン数を記録する
+    """
+
+    def __init__(self, embeddings, model):
+        self.embeddings = embeddings
+        self.model = model
+
+    def embed_documents(self, texts):
+        _record_embedding(ct.TOKEN_STAGE_INDEX_BUILD, self.model, texts)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        _record_embedding(ct.TOKEN_STAGE_QUERY_EMBEDDING, self.model, [text])
+        return self.embeddings.embed_query(text)
+
+
+############################################################
+# 関数定義
+############################################################
+
+def start_recording():
+    """
+    以降のモデル呼び出しのトークン数の記録を開始
+
+    Returns:
+        記録先のオブジェクト
+    """
+    recorder = UsageRecorder()
+    _current_recorder.set(recorder)
+    return recorder
+
+
+def stop_recording():
+    """
+    トークン数の記録を終了
+    """
+    _current_recorder.set(None)
+
+
+def new_session_usage():
+    """
+    セッション単位のトークン数の集計用データを作成
+    """
+    return {"total": _empty_usage(), "by_mode": {}, "by_stage": {}}
+
+
+def add_to_session(session_usage, recorder, mode=None):
+    """
+    1リクエスト分のトークン数を、セッション単位・1日単位の集計に加算
+
+    Args:
+        session_usage: new_session_usage で作成した集計用データ
+        recorder: リクエストのトークン数を記録したオブジェクト
+        mode: 利用目的
+
+    Returns:
+        当日の合計トークン数
+    """
+    request_total = recorder.total()
+    _merge_usage(session_usage["total"], request_total)
+    if mode:
+        _merge_usage(session_usage["by_mode"].setdefault(mode, _empty_usage()), request_total)
+    for stage, usage in recorder.stages.items():
+        _merge_usage(session_usage["by_stage"].setdefault(stage, _empty_usage()), usage)
+
+    return add_to_daily(recorder)
+
+
+def add_to_daily(recorder):
+    """
+    トークン数を1日単位の集計にのみ加算（ベクターストア作成時など、セッションの上限に含めないもの）
+
+    Args:
+        recorder: トークン数を記録したオブジェクト
+
+    Returns:
+        当日の合計トークン数
+    """
+    with _locked_daily_usage():
+        today = date.today().isoformat()
+        daily_tokens = _read_daily_tokens(today) + _total_tokens(recorder.total())
+        _write_daily_tokens(today, daily_tokens)
+        return daily_tokens
+
+
+def check_budget(session_usage):
+    """
+    セッション単位・1日単位のトークン数が上限に達していれば、エラーを送出
+
+    上限（ct.SESSION_TOKEN_BUDGET、ct.DAILY_TOKEN_BUDGET）がNoneの場合は判定しません。
+    1日単位の合計は、ログ出力先のフォルダに保存した全プロセス共通の値で判定します。
+    """
+    if ct.SESSION_TOKEN_BUDGET is not None and _total_tokens(session_usage["total"]) >= ct.SESSION_TOKEN_BUDGET:
+        raise TokenBudgetExceededError(ct.SESSION_TOKEN_BUDGET_EXCEEDED_MESSAGE)
+    with _locked_daily_usage():
+        daily_tokens = _read_daily_tokens(date.today().isoformat())
+    if ct.DAILY_TOKEN_BUDGET is not None and daily_tokens >= ct.DAILY_TOKEN_BUDGET:
+        raise TokenBudgetExceededError(ct.DAILY_TOKEN_BUDGET_EXCEEDED_MESSAGE)
+
+
+def log_usage(recorder, session_usage, daily_tokens, mode=None):
+    """
+    リクエスト単位・セッション単位・1日単位のトークン数をログに出力
+
+    ベクターストア作成時など、セッションの集計に含めない場合は session_usage にNoneを渡します。
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+    usage_log = {
+        "application_mode": mode,
+        "request": {"total": recorder.total(), "by_stage": recorder.stages},
+        "daily_total_tokens": daily_tokens,
+    }
+    if session_usage is not None:
+        usage_log["session"] = session_usage
+    logger.info({"token_usage": usage_log})
+
+
+def count_tokens(text, model):
+    """
+    tiktokenでテキストのトークン数を数える
+
+    エンコーディングの取得に失敗した場合（オフライン環境など）は、文字数で概算します。
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def calculate_cost(model, prompt_tokens, completion_tokens):
+    """
+    トークン数から料金（米ドル）を計算（料金表にないモデルは0とする）
+    """
+    prompt_price, completion_price = ct.TOKEN_PRICES_PER_1M.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+@contextmanager
+def _locked_daily_usage():
+    """
+    1日単位の合計トークン数のファイルを、スレッド間・プロセス間で排他的に読み書きする
+    """
+    os.makedirs(ct.LOG_DIR_PATH, exist_ok=True)
+    lock_path = os.path.join(ct.LOG_DIR_PATH, ct.DAILY_TOKEN_USAGE_LOCK_FILE)
+    with _daily_lock, open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _daily_usage_path(day):
+    return os.path.join(ct.LOG_DIR_PATH, ct.DAILY_TOKEN_USAGE_FILE_TEMPLATE.format(date=day))
+
+
+def _read_daily_tokens(day):
+    """
+    保存済みの1日単位の合計トークン数を読み込む（ファイルがない場合は0）
+    """
+    try:
+        with open(_daily_usage_path(day), encoding="utf-8") as f:
+            return json.load(f)["total_tokens"]
+    except FileNotFoundError:
+        return 0
+
+
+def _write_daily_tokens(day, daily_tokens):
+    """
+    1日単位の合計トークン数を保存する（書き込み途中のファイルを読まないよう、一時ファイルから置き換える）
+    """
+    path = _daily_usage_path(day)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"date": day, "total_tokens": daily_tokens}, f)
+    os.replace(temp_path, path)
+
+
+def _get_encoding(model):
+    if model not in _encodings:
+        try:
+            tiktoken = startup.timed_import("tiktoken")
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding(ct.DEFAULT_TIKTOKEN_ENCODING)
+        except Exception:
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def _provider_usage(response):
+    """
+    OpenAIのレスポンスに含まれる使用量（入力トークン数, 出力トークン数）を取得（含まれない場合はNone）
+    """
+    prompt_tokens, completion_tokens, found = 0, 0, False
+    for generation_list in response.generations:
+        for generation in generation_list:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                prompt_tokens += usage_metadata.get("input_tokens", 0)
+                completion_tokens += usage_metadata.get("output_tokens", 0)
+                found = True
+    if found:
+        return prompt_tokens, completion_tokens
+
+    token_usage = (response.llm_output or {}).get("token_usage")
+    if token_usage:
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+    return None
+
+
+def _record_embedding(stage, model, texts):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return
+    recorder.add(stage, model, sum(count_tokens(text, model) for text in texts))
+
+
+def _empty_usage():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "sources": {}}
+
+
+def _merge_usage(target, usage):
+    target["calls"] += usage["calls"]
+    target["prompt_tokens"] += usage["prompt_tokens"]
+    target["completion_tokens"] += usage["completion_tokens"]
+    target["cost_usd"] += usage["cost_usd"]
+    for source, count in usage["sources"].items():
+        target["sources"][source] = target["sources"].get(source, 0) + count
+
+
+def _total_tokens(usage):
+    return usage["prompt_tokens"] + usage["completion_tokens"]
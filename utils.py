@@ -6,6 +6,8 @@
 # 1. ライブラリの読み込み
 ############################################################
 import os
+import json
+import logging
 import streamlit as st
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
@@ -13,6 +15,8 @@ from langchain.schema import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain.retrievers.multi_query import MultiQueryRetriever
 import constants as ct
+import metadata_index
+import token_usage
 
 ############################################################
 # 2. 関数定義
@@ -21,7 +25,28 @@ import constants as ct
 def get_llm_response(chat_message: str):
     """
     LLMから回答を取得します。
+    トークン数の上限を確認したうえで、このリクエストで使用したトークン数を集計します。
     """
+    # トークン数の上限を超えていないか確認し、このリクエストのトークン数の記録を開始
+    token_usage.check_budget(st.session_state.token_usage)
+    recorder = token_usage.start_recording()
+    try:
+        return _invoke_rag_chain(chat_message)
+    finally:
+        # 途中で失敗した場合も、それまでに使用したトークン数をセッション・1日単位の集計に加算し、ログ出力
+        token_usage.stop_recording()
+        daily_tokens = token_usage.add_to_session(
+            st.session_state.token_usage, recorder, st.session_state.mode
+        )
+        token_usage.log_usage(recorder, st.session_state.token_usage, daily_tokens, st.session_state.mode)
+
+
+def _invoke_rag_chain(chat_message: str):
+    """
+    Retrieverで社内文書を検索し、LLMから回答を取得します。
+    """
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
     # ------------------------------------------
     # 1. Retrieverの準備
     # ------------------------------------------
@@ -29,10 +54,32 @@ def get_llm_response(chat_message: str):
     # initialize.pyでst.session_state.retrieverに格納されている想定
     base_retriever = st.session_state.retriever
 
+    # サイドバーの検索範囲や入力内容に含まれる会社名・カテゴリから、ベクター検索前に対象を絞り込む
+    search_filter = metadata_index.build_search_filter(
+        chat_message,
+        st.session_state.get("search_scope"),
+        st.session_state.get("metadata_index", {}),
+    )
+    if search_filter:
+        logger.info({"search_filter": search_filter})
+        base_retriever = st.session_state.vectorstore.as_retriever(
+            search_kwargs={"k": ct.TOP_K_DOCUMENTS, "filter": search_filter}
+        )
+
     # ユーザーの多様な質問に対応できるよう、MultiQueryRetrieverを使用
-    llm = ChatOpenAI(temperature=0)
+    # （処理段階ごとにトークン数を集計するため、検索クエリ生成用と回答生成用でLLMを分ける）
+    multi_query_llm = ChatOpenAI(
+        model=ct.MODEL,
+        temperature=ct.TEMPERATURE,
+        callbacks=[token_usage.TokenUsageCallbackHandler(ct.TOKEN_STAGE_MULTI_QUERY, ct.MODEL)],
+    )
+    llm = ChatOpenAI(
+        model=ct.MODEL,
+        temperature=ct.TEMPERATURE,
+        callbacks=[token_usage.TokenUsageCallbackHandler(ct.TOKEN_STAGE_ANSWER, ct.MODEL)],
+    )
     retriever = MultiQueryRetriever.from_llm(
-        retriever=base_retriever, llm=llm
+        retriever=base_retriever, llm=multi_query_llm
     )
 
     # ▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼▼
@@ -72,11 +119,13 @@ def get_llm_response(chat_message: str):
     # ------------------------------------------
     # Chainを構築
     # retrieved_docsを直接contextとして渡すように変更
+    # （Retrieverを再度呼び出すと、検索クエリの生成が2回課金され、表示するドキュメントと
+    #   回答の根拠のドキュメントが食い違うため）
     def format_docs(docs):
         return "\n\n".join(doc.page_content for doc in docs)
 
     rag_chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
+        {"context": lambda _: format_docs(retrieved_docs), "question": RunnablePassthrough()}
         | prompt
         | llm
         | StrOutputParser()
@@ -107,6 +156,37 @@ def get_source_icon(file_path: str) -> str:
         return ct.DOC_SOURCE_ICON
 
 
+def get_source_locations(document) -> list:
+    """
+    ドキュメントのありか（ファイルパスとページ番号）の一覧を返します。
+    重複排除で統合されたチャンクの場合は、統合元のうちチャンクと同じフォルダ（カテゴリ・会社など）の
+    ありかを返します（検索範囲を絞り込んだ際に、範囲外のファイルを表示しないため）。
+    """
+    if "sources" in document.metadata:
+        scope = {
+            field: document.metadata[field]
+            for field in ct.DEDUP_SCOPE_FIELDS if document.metadata.get(field)
+        }
+        locations = [
+            location for location in json.loads(document.metadata["sources"])
+            if all(
+                metadata_index.derive_metadata(location["source"]).get(field) == value
+                for field, value in scope.items()
+            )
+        ]
+    else:
+        locations = [{"source": document.metadata["source"], "page": document.metadata.get("page")}]
+
+    # ページ番号は1始まりに変換（ページを持たないファイルは0）
+    return [
+        {
+            "source": location["source"],
+            "page_number": location["page"] + 1 if location.get("page") is not None else 0,
+        }
+        for location in locations
+    ]
+
+
 def build_error_message(message: str) -> str:
     """
     エラーメッセージを整形します。